@@ -1,15 +1,20 @@
 import asyncio
 import os
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Dict
+from typing import Dict, Optional
 
+import orjson
 from aiogram import Bot, Dispatcher, F
-from aiogram.filters import Command
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.filters import Command, StateFilter
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
 from dotenv import load_dotenv
+from redis.asyncio import Redis
 
 # Загружаем переменные окружения
 load_dotenv()
@@ -24,15 +29,23 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN не найден в переменных окружения!")
 
-bot = Bot(token=BOT_TOKEN)
-storage = MemoryStorage()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# orjson сериализует запросы к Telegram заметно быстрее стандартного json
+session = AiohttpSession(
+    json_loads=orjson.loads,
+    json_dumps=lambda obj: orjson.dumps(obj).decode(),
+)
+bot = Bot(token=BOT_TOKEN, session=session)
+# Статистика, интервалы и состояния FSM живут в Redis и переживают перезапуск бота
+redis_client = Redis.from_url(REDIS_URL, decode_responses=True)
+storage = RedisStorage.from_url(REDIS_URL)
 dp = Dispatcher(storage=storage)
 
-# Хранилище активных таймеров и статистики пользователей
+# В процессе храним только ссылки на задачи активных таймеров и циклов
 active_timers: Dict[int, asyncio.Task] = {}
-user_stats: Dict[int, Dict[str, int]] = {}  # {user_id: {"pomodoros": 0, "short_breaks": 0, "long_breaks": 0}}
-user_intervals: Dict[int, Dict[str, int]] = {}  # {user_id: {"pomodoro": 25, "short_break": 5, "long_break": 15}}
 active_cycles: Dict[int, asyncio.Task] = {}  # Активные циклы Pomodoro
+_last_edit: Dict[tuple, str] = {}  # {(chat_id, message_id): последний отправленный текст}
 
 
 class PomodoroStates(StatesGroup):
@@ -41,22 +54,105 @@ class PomodoroStates(StatesGroup):
     waiting_for_long_break_interval = State()
 
 
-def get_user_stats(user_id: int) -> Dict[str, int]:
+# Поле статистики в Redis для каждого типа таймера
+_STATS_FIELD: Dict[str, str] = {
+    "pomodoro": "pomodoros",
+    "short_break": "short_breaks",
+    "long_break": "long_breaks",
+}
+
+
+@dataclass(slots=True)
+class Stats:
+    """Счетчики завершенных таймеров пользователя"""
+    pomodoros: int = 0
+    short_breaks: int = 0
+    long_breaks: int = 0
+
+
+# Общий блок "текущие настройки", рендерится один раз при изменении интервалов
+_SETTINGS_TMPL = (
+    "• Pomodoro: {pomodoro_min} мин\n"
+    "• Короткий перерыв: {short_break_min} мин\n"
+    "• Длинный перерыв: {long_break_min} мин"
+)
+
+
+@dataclass(slots=True)
+class Intervals:
+    """Интервалы пользователя в секундах"""
+    pomodoro: int = POMODORO_DURATION
+    short_break: int = SHORT_BREAK_DURATION
+    long_break: int = LONG_BREAK_DURATION
+    # Значения в минутах: считаются один раз при изменении, а не при каждом рендере
+    pomodoro_min: int = 0
+    short_break_min: int = 0
+    long_break_min: int = 0
+    # Готовый текстовый блок с настройками для сообщений
+    settings_block: str = ""
+    # Кэш основной клавиатуры, сбрасывается при изменении интервалов
+    main_kb: Optional[InlineKeyboardMarkup] = None
+
+    def __post_init__(self):
+        self.refresh_minutes()
+
+    def refresh_minutes(self):
+        """Пересчитать кэшированные значения в минутах и блок настроек"""
+        self.pomodoro_min = self.pomodoro // 60
+        self.short_break_min = self.short_break // 60
+        self.long_break_min = self.long_break // 60
+        self.settings_block = _SETTINGS_TMPL.format(
+            pomodoro_min=self.pomodoro_min,
+            short_break_min=self.short_break_min,
+            long_break_min=self.long_break_min,
+        )
+        self.main_kb = None
+
+
+# Кэш интервалов в процессе, чтобы не ходить в Redis на каждое сообщение
+user_intervals: Dict[int, Intervals] = {}
+
+
+async def get_user_stats(user_id: int) -> Stats:
     """Получить статистику пользователя"""
-    if user_id not in user_stats:
-        user_stats[user_id] = {"pomodoros": 0, "short_breaks": 0, "long_breaks": 0}
-    return user_stats[user_id]
+    data = await redis_client.hgetall(f"stats:{user_id}")
+    return Stats(
+        pomodoros=int(data.get("pomodoros", 0)),
+        short_breaks=int(data.get("short_breaks", 0)),
+        long_breaks=int(data.get("long_breaks", 0)),
+    )
+
 
+async def increment_user_stat(user_id: int, timer_type: str) -> int:
+    """Увеличить счетчик завершенных таймеров, вернуть новое значение"""
+    # Пайплайн отправляет обе команды одним сетевым запросом
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.hincrby(f"stats:{user_id}", _STATS_FIELD[timer_type], 1)
+        pipe.hset(f"stats:{user_id}", "last_completed", int(datetime.now().timestamp()))
+        new_value, _ = await pipe.execute()
+    return new_value
 
-def get_user_intervals(user_id: int) -> Dict[str, int]:
+
+async def get_user_intervals(user_id: int) -> Intervals:
     """Получить интервалы пользователя"""
-    if user_id not in user_intervals:
-        user_intervals[user_id] = {
-            "pomodoro": POMODORO_DURATION,
-            "short_break": SHORT_BREAK_DURATION,
-            "long_break": LONG_BREAK_DURATION
-        }
-    return user_intervals[user_id]
+    intervals = user_intervals.get(user_id)
+    if intervals is None:
+        data = await redis_client.hgetall(f"intervals:{user_id}")
+        intervals = Intervals(
+            pomodoro=int(data.get("pomodoro", POMODORO_DURATION)),
+            short_break=int(data.get("short_break", SHORT_BREAK_DURATION)),
+            long_break=int(data.get("long_break", LONG_BREAK_DURATION)),
+        )
+        user_intervals[user_id] = intervals
+    return intervals
+
+
+async def set_user_interval(user_id: int, key: str, seconds: int):
+    """Сохранить новое значение интервала пользователя"""
+    intervals = await get_user_intervals(user_id)
+    setattr(intervals, key, seconds)
+    intervals.refresh_minutes()
+    await redis_client.hset(f"intervals:{user_id}", key, seconds)
 
 
 def format_time(seconds: int) -> str:
@@ -68,124 +164,154 @@ def format_time(seconds: int) -> str:
     return f"{minutes:02d}:{secs:02d}"
 
 
-def get_main_keyboard(user_id: int = None) -> InlineKeyboardMarkup:
+# Эмодзи и название для каждого типа таймера
+_TYPE_META: Dict[str, tuple] = {
+    "pomodoro": ("🍅", "Pomodoro"),
+    "short_break": ("☕", "Короткий перерыв"),
+    "long_break": ("🌴", "Длинный перерыв"),
+}
+
+# Статичные клавиатуры и кнопки строим один раз при импорте, а не на каждый вызов
+_START_CYCLE_ROW = [InlineKeyboardButton(text="🔄 Запустить полный цикл Pomodoro", callback_data="start_full_cycle")]
+_STATS_ROW = [InlineKeyboardButton(text="📊 Статистика", callback_data="show_stats")]
+_STOP_ROW = [InlineKeyboardButton(text="⏹️ Остановить таймер/цикл", callback_data="stop_timer")]
+
+_SETTINGS_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_main")]
+])
+
+_STOP_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="⏹️ Остановить цикл", callback_data="stop_timer")]
+])
+
+
+async def get_main_keyboard(user_id: int = None) -> InlineKeyboardMarkup:
     """Создать основную клавиатуру"""
+    intervals = None
     if user_id:
-        intervals = get_user_intervals(user_id)
-        pomodoro_min = intervals['pomodoro'] // 60
-        short_min = intervals['short_break'] // 60
-        long_min = intervals['long_break'] // 60
-        pomodoro_text = f"🍅 Настроить Pomodoro ({pomodoro_min} мин)"
-        short_text = f"☕ Настроить короткий перерыв ({short_min} мин)"
-        long_text = f"🌴 Настроить длинный перерыв ({long_min} мин)"
+        intervals = await get_user_intervals(user_id)
+        # Клавиатура пересобирается только после изменения интервалов
+        if intervals.main_kb is not None:
+            return intervals.main_kb
+        pomodoro_text = f"🍅 Настроить Pomodoro ({intervals.pomodoro_min} мин)"
+        short_text = f"☕ Настроить короткий перерыв ({intervals.short_break_min} мин)"
+        long_text = f"🌴 Настроить длинный перерыв ({intervals.long_break_min} мин)"
     else:
         pomodoro_text = "🍅 Настроить Pomodoro"
         short_text = "☕ Настроить короткий перерыв"
         long_text = "🌴 Настроить длинный перерыв"
-    
+
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔄 Запустить полный цикл Pomodoro", callback_data="start_full_cycle")],
+        _START_CYCLE_ROW,
         [InlineKeyboardButton(text=pomodoro_text, callback_data="set_pomodoro_interval")],
         [InlineKeyboardButton(text=short_text, callback_data="set_short_break_interval")],
         [InlineKeyboardButton(text=long_text, callback_data="set_long_break_interval")],
-        [InlineKeyboardButton(text="📊 Статистика", callback_data="show_stats")],
-        [InlineKeyboardButton(text="⏹️ Остановить таймер/цикл", callback_data="stop_timer")]
+        _STATS_ROW,
+        _STOP_ROW
     ])
+    if intervals is not None:
+        intervals.main_kb = keyboard
     return keyboard
 
 
 def get_settings_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура для настроек"""
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_main")]
-    ])
-    return keyboard
+    return _SETTINGS_KB
 
 
 def get_stop_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура с кнопкой остановки для уведомлений"""
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="⏹️ Остановить цикл", callback_data="stop_timer")]
-    ])
-    return keyboard
+    return _STOP_KB
 
 
 async def send_timer_update(chat_id: int, message_id: int, remaining_seconds: int, timer_type: str, motivational_text: str = ""):
     """Отправить обновление таймера"""
     time_str = format_time(remaining_seconds)
-    emoji = "🍅" if timer_type == "pomodoro" else "☕" if timer_type == "short_break" else "🌴"
-    type_name = "Pomodoro" if timer_type == "pomodoro" else "Короткий перерыв" if timer_type == "short_break" else "Длинный перерыв"
-    
+    emoji, type_name = _TYPE_META[timer_type]
+
     # Формируем текст с подбадривающим сообщением, если оно есть
     if motivational_text:
         text = f"{emoji} {type_name}\n\n⏱ Осталось времени: {time_str}\n\n{motivational_text}"
     else:
         text = f"{emoji} {type_name}\n\n⏱ Осталось времени: {time_str}"
-    
+
+    # Не ходим в API, если текст сообщения не изменился
+    key = (chat_id, message_id)
+    if _last_edit.get(key) == text:
+        return
+
     try:
         await bot.edit_message_text(
             chat_id=chat_id,
             message_id=message_id,
             text=text,
-            reply_markup=get_stop_keyboard()
+            reply_markup=_STOP_KB
         )
-    except Exception:
-        pass  # Игнорируем ошибки редактирования (например, если сообщение уже было изменено)
+        _last_edit[key] = text
+    except TelegramRetryAfter as e:
+        # Telegram просит притормозить - ждем указанное время вместо новых запросов
+        await asyncio.sleep(e.retry_after)
+    except TelegramBadRequest:
+        pass  # Например, сообщение уже было изменено или удалено
 
 
 async def run_timer(chat_id: int, message_id: int, duration: int, timer_type: str, user_id: int, is_cycle: bool = False, notification_message_id: int = None, motivational_text: str = ""):
     """Запустить таймер"""
-    remaining = duration
-    update_interval = 1  # Обновлять каждую секунду для отображения обратного отсчета
-    
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + duration  # монотонный дедлайн, чтобы сон не накапливал дрейф
+
     # Обновляем только уведомление, если оно есть, иначе основное сообщение
     target_message_id = notification_message_id if notification_message_id else message_id
-    
-    # Отправляем начальное обновление таймера
-    await send_timer_update(chat_id, target_message_id, remaining, timer_type, motivational_text)
-    
-    while remaining > 0:
-        await asyncio.sleep(min(update_interval, remaining))
-        remaining -= min(update_interval, remaining)
-        
-        if remaining > 0:
-            await send_timer_update(chat_id, target_message_id, remaining, timer_type, motivational_text)
-    
+
+    try:
+        # Отправляем начальное обновление таймера
+        await send_timer_update(chat_id, target_message_id, duration, timer_type, motivational_text)
+
+        # Сообщение правим только на переходах: старт, середина, завершение.
+        # Постоянный обратный отсчет упирается в лимиты Telegram на редактирование.
+        halfway = duration // 2
+        if halfway > 0:
+            await asyncio.sleep(max(0.0, deadline - halfway - loop.time()))
+            remaining = max(0, round(deadline - loop.time()))
+            if remaining > 0:
+                await send_timer_update(chat_id, target_message_id, remaining, timer_type, motivational_text)
+
+        # Досыпаем до дедлайна
+        await asyncio.sleep(max(0.0, deadline - loop.time()))
+    finally:
+        # Чистим кэш текста и при обычном завершении, и при отмене таймера
+        _last_edit.pop((chat_id, target_message_id), None)
+
     # Таймер завершен
-    emoji = "🍅" if timer_type == "pomodoro" else "☕" if timer_type == "short_break" else "🌴"
-    type_name = "Pomodoro" if timer_type == "pomodoro" else "Короткий перерыв" if timer_type == "short_break" else "Длинный перерыв"
-    
-    # Обновляем статистику
-    stats = get_user_stats(user_id)
-    if timer_type == "pomodoro":
-        stats["pomodoros"] += 1
-    elif timer_type == "short_break":
-        stats["short_breaks"] += 1
-    else:
-        stats["long_breaks"] += 1
-    
+    emoji, type_name = _TYPE_META[timer_type]
+
+    # Обновляем статистику (атомарный инкремент в Redis)
+    completed = await increment_user_stat(user_id, timer_type)
+
     # Отправляем уведомление о завершении
     completion_text = f"✅ {type_name} завершен!\n\n"
     if timer_type == "pomodoro":
-        completion_text += f"🎉 Поздравляем! Вы завершили {stats['pomodoros']} сессий Pomodoro!"
-        if stats["pomodoros"] % 4 == 0:
+        completion_text += f"🎉 Поздравляем! Вы завершили {completed} сессий Pomodoro!"
+        if completed % 4 == 0:
             completion_text += "\n\n💡 Рекомендуется сделать длинный перерыв!"
     else:
         completion_text += "💪 Готовы продолжить работу?"
     
     if not is_cycle:
+        # Клавиатуру строим один раз и для редактирования, и для запасной отправки
+        keyboard = await get_main_keyboard(user_id)
         try:
             await bot.edit_message_text(
                 chat_id=chat_id,
                 message_id=message_id,
                 text=completion_text,
-                reply_markup=get_main_keyboard(user_id)
+                reply_markup=keyboard
             )
         except Exception:
             await bot.send_message(
                 chat_id=chat_id,
                 text=completion_text,
-                reply_markup=get_main_keyboard(user_id)
+                reply_markup=keyboard
             )
         
         # Удаляем таймер из активных
@@ -197,7 +323,7 @@ async def run_timer(chat_id: int, message_id: int, duration: int, timer_type: st
 
 async def run_full_cycle(chat_id: int, message_id: int, user_id: int):
     """Запустить полный цикл Pomodoro (4 pomodoro + перерывы)"""
-    intervals = get_user_intervals(user_id)
+    intervals = await get_user_intervals(user_id)
     pomodoro_count = 0
     is_first_pomodoro = True
     
@@ -205,11 +331,12 @@ async def run_full_cycle(chat_id: int, message_id: int, user_id: int):
         # Уведомление о начале цикла
         first_notification = await bot.send_message(
             chat_id=chat_id,
-            text=f"🔔 **ЦИКЛ ПОМОДОРО ЗАПУЩЕН!**\n\n🍅 Первый Pomodoro начинается!\n\n⏱ Осталось времени: {format_time(intervals['pomodoro'])}\n\n💪  Время сосредоточиться и работать продуктивно!",
+            text=f"🔔 **ЦИКЛ ПОМОДОРО ЗАПУЩЕН!**\n\n🍅 Первый Pomodoro начинается!\n\n⏱ Осталось времени: {format_time(intervals.pomodoro)}\n\n💪  Время сосредоточиться и работать продуктивно!",
             reply_markup=get_stop_keyboard()
         )
         
-        while user_id in active_cycles:  # Продолжаем пока цикл активен
+        # Крутимся до остановки: отмена задачи прилетает CancelledError прямо в sleep
+        while True:
             pomodoro_count += 1
             
             # Уведомление о начале Pomodoro (кроме первого)
@@ -217,7 +344,7 @@ async def run_full_cycle(chat_id: int, message_id: int, user_id: int):
             if not is_first_pomodoro:
                 notification_msg = await bot.send_message(
                     chat_id=chat_id,
-                    text=f"🔔 **НАЧАЛО РАБОТЫ!**\n\n🍅 Pomodoro #{pomodoro_count} начинается!\n\n⏱ Осталось времени: {format_time(intervals['pomodoro'])}\n\n💪 Время сосредоточиться и работать продуктивно!",
+                    text=f"🔔 **НАЧАЛО РАБОТЫ!**\n\n🍅 Pomodoro #{pomodoro_count} начинается!\n\n⏱ Осталось времени: {format_time(intervals.pomodoro)}\n\n💪 Время сосредоточиться и работать продуктивно!",
                     reply_markup=get_stop_keyboard()
                 )
             # Для первого Pomodoro используем первое уведомление, для остальных - новое
@@ -233,21 +360,17 @@ async def run_full_cycle(chat_id: int, message_id: int, user_id: int):
             
             is_first_pomodoro = False
             
-            await run_timer(chat_id, message_id, intervals['pomodoro'], "pomodoro", user_id, is_cycle=True, notification_message_id=notification_id, motivational_text=motivational_text)
-            
-            # Проверяем, не остановлен ли цикл
-            if user_id not in active_cycles:
-                break
-            
+            await run_timer(chat_id, message_id, intervals.pomodoro, "pomodoro", user_id, is_cycle=True, notification_message_id=notification_id, motivational_text=motivational_text)
+
             # Перерыв (каждый 4-й - длинный, остальные - короткие)
             if pomodoro_count % 4 == 0:
                 break_type = "long_break"
-                break_duration = intervals['long_break']
+                break_duration = intervals.long_break
                 break_emoji = "🌴"
                 break_name = "Длинный перерыв"
             else:
                 break_type = "short_break"
-                break_duration = intervals['short_break']
+                break_duration = intervals.short_break
                 break_emoji = "☕"
                 break_name = "Короткий перерыв"
             
@@ -261,38 +384,24 @@ async def run_full_cycle(chat_id: int, message_id: int, user_id: int):
             # Обновляем только уведомление с таймером, главное сообщение не трогаем
             await run_timer(chat_id, message_id, break_duration, break_type, user_id, is_cycle=True, notification_message_id=notification.message_id, motivational_text="😌 Расслабьтесь и восстановите силы!")
             
-            # Проверяем, не остановлен ли цикл
-            if user_id not in active_cycles:
-                break
-        
-        # Цикл завершен или остановлен
-        if user_id in active_cycles:
-            await bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=message_id,
-                text=f"⏹️ Цикл Pomodoro остановлен.\n\n✅ Завершено Pomodoro: {pomodoro_count}",
-                reply_markup=get_main_keyboard(user_id)
-            )
-            del active_cycles[user_id]
     except asyncio.CancelledError:
         await bot.edit_message_text(
             chat_id=chat_id,
             message_id=message_id,
             text=f"⏹️ Цикл Pomodoro остановлен.\n\n✅ Завершено Pomodoro: {pomodoro_count}",
-            reply_markup=get_main_keyboard(user_id)
+            reply_markup=await get_main_keyboard(user_id)
         )
-        if user_id in active_cycles:
-            del active_cycles[user_id]
+        active_cycles.pop(user_id, None)
 
 
 @dp.message(Command("start"))
 async def cmd_start(message: Message):
     """Обработчик команды /start"""
     user_id = message.from_user.id
-    intervals = get_user_intervals(user_id)
-    pomodoro_min = intervals['pomodoro'] // 60
-    short_min = intervals['short_break'] // 60
-    long_min = intervals['long_break'] // 60
+    intervals = await get_user_intervals(user_id)
+    pomodoro_min = intervals.pomodoro_min
+    short_min = intervals.short_break_min
+    long_min = intervals.long_break_min
     welcome_text = (
         "🍅 Добро пожаловать в Pomodoro бота!\n\n"
         "Техника Pomodoro поможет вам повысить продуктивность:\n"
@@ -302,7 +411,7 @@ async def cmd_start(message: Message):
         "Используйте кнопки ниже для управления таймерами.\n"
         "Вы можете настроить интервалы по своему желанию!"
     )
-    await message.answer(welcome_text, reply_markup=get_main_keyboard(user_id))
+    await message.answer(welcome_text, reply_markup=await get_main_keyboard(user_id))
 
 
 @dp.message(Command("help"))
@@ -323,34 +432,29 @@ async def cmd_help(message: Message):
         "⏹️ Остановить таймер/цикл - остановить текущий таймер или цикл\n\n"
         "💡 Совет: После каждых 4 Pomodoro делается длинный перерыв!"
     )
-    await message.answer(help_text, reply_markup=get_main_keyboard(message.from_user.id))
+    await message.answer(help_text, reply_markup=await get_main_keyboard(message.from_user.id))
 
 
 @dp.message(Command("stats"))
 async def cmd_stats(message: Message):
     """Обработчик команды /stats"""
     user_id = message.from_user.id
-    stats = get_user_stats(user_id)
-    intervals = get_user_intervals(user_id)
-    pomodoro_min = intervals['pomodoro'] // 60
-    short_min = intervals['short_break'] // 60
-    long_min = intervals['long_break'] // 60
+    stats = await get_user_stats(user_id)
+    intervals = await get_user_intervals(user_id)
     stats_text = (
         f"📊 Ваша статистика:\n\n"
-        f"🍅 Завершено Pomodoro: {stats['pomodoros']}\n"
-        f"☕ Коротких перерывов: {stats['short_breaks']}\n"
-        f"🌴 Длинных перерывов: {stats['long_breaks']}\n\n"
+        f"🍅 Завершено Pomodoro: {stats.pomodoros}\n"
+        f"☕ Коротких перерывов: {stats.short_breaks}\n"
+        f"🌴 Длинных перерывов: {stats.long_breaks}\n\n"
         f"⚙️ Текущие настройки:\n"
-        f"• Pomodoro: {pomodoro_min} мин\n"
-        f"• Короткий перерыв: {short_min} мин\n"
-        f"• Длинный перерыв: {long_min} мин\n"
+        f"{intervals.settings_block}\n"
     )
     
-    if stats['pomodoros'] > 0:
-        total_work_time = stats['pomodoros'] * intervals['pomodoro']
+    if stats.pomodoros > 0:
+        total_work_time = stats.pomodoros * intervals.pomodoro
         stats_text += f"\n⏱ Всего времени работы: {total_work_time} секунд"
     
-    await message.answer(stats_text, reply_markup=get_main_keyboard(user_id))
+    await message.answer(stats_text, reply_markup=await get_main_keyboard(user_id))
 
 
 @dp.callback_query(F.data == "start_full_cycle")
@@ -365,16 +469,11 @@ async def start_full_cycle_handler(callback: CallbackQuery):
     
     await callback.answer("🔄 Полный цикл Pomodoro запущен!")
     
-    intervals = get_user_intervals(user_id)
-    pomodoro_min = intervals['pomodoro'] // 60
-    short_min = intervals['short_break'] // 60
-    long_min = intervals['long_break'] // 60
+    intervals = await get_user_intervals(user_id)
     message = await callback.message.edit_text(
         f"🔄 Полный цикл Pomodoro запущен!\n\n"
         f"⚙️ Настройки:\n"
-        f"• Pomodoro: {pomodoro_min} мин\n"
-        f"• Короткий перерыв: {short_min} мин\n"
-        f"• Длинный перерыв: {long_min} мин\n\n"
+        f"{intervals.settings_block}\n\n"
         f"Цикл будет работать до остановки.",
         reply_markup=None
     )
@@ -385,130 +484,71 @@ async def start_full_cycle_handler(callback: CallbackQuery):
         message.message_id,
         user_id
     ))
+    # Подчищаем запись при любом завершении задачи, чтобы словарь не рос
+    task.add_done_callback(lambda t, uid=user_id: active_cycles.pop(uid, None))
     active_cycles[user_id] = task
 
 
-@dp.callback_query(F.data == "set_pomodoro_interval")
-async def set_pomodoro_interval(callback: CallbackQuery, state: FSMContext):
-    """Начать настройку интервала Pomodoro"""
-    user_id = callback.from_user.id
-    
-    if user_id in active_timers or user_id in active_cycles:
-        await callback.answer("⏸ Остановите активный таймер или цикл перед изменением настроек!", show_alert=True)
-        return
-    
-    intervals = get_user_intervals(user_id)
-    pomodoro_min = intervals['pomodoro'] // 60
-    await callback.answer()
-    await callback.message.edit_text(
-        f"🍅 Настройка интервала Pomodoro\n\n"
-        f"Текущее значение: {pomodoro_min} минут\n\n"
-        f"Введите новое значение в минутах (число):",
-        reply_markup=get_settings_keyboard()
-    )
-    await state.set_state(PomodoroStates.waiting_for_pomodoro_interval)
+# Состояние FSM, заголовок и поле минут для каждой кнопки настройки интервала
+_SET_INTERVAL_CALLBACKS: Dict[str, tuple] = {
+    "set_pomodoro_interval": (PomodoroStates.waiting_for_pomodoro_interval, "🍅 Настройка интервала Pomodoro", "pomodoro_min"),
+    "set_short_break_interval": (PomodoroStates.waiting_for_short_break_interval, "☕ Настройка интервала короткого перерыва", "short_break_min"),
+    "set_long_break_interval": (PomodoroStates.waiting_for_long_break_interval, "🌴 Настройка интервала длинного перерыва", "long_break_min"),
+}
 
 
-@dp.callback_query(F.data == "set_short_break_interval")
-async def set_short_break_interval(callback: CallbackQuery, state: FSMContext):
-    """Начать настройку интервала короткого перерыва"""
+@dp.callback_query(F.data.in_(_SET_INTERVAL_CALLBACKS))
+async def set_interval_handler(callback: CallbackQuery, state: FSMContext):
+    """Начать настройку выбранного интервала"""
     user_id = callback.from_user.id
-    
-    if user_id in active_timers or user_id in active_cycles:
-        await callback.answer("⏸ Остановите активный таймер или цикл перед изменением настроек!", show_alert=True)
-        return
-    
-    intervals = get_user_intervals(user_id)
-    short_min = intervals['short_break'] // 60
-    await callback.answer()
-    await callback.message.edit_text(
-        f"☕ Настройка интервала короткого перерыва\n\n"
-        f"Текущее значение: {short_min} минут\n\n"
-        f"Введите новое значение в минутах (число):",
-        reply_markup=get_settings_keyboard()
-    )
-    await state.set_state(PomodoroStates.waiting_for_short_break_interval)
 
-
-@dp.callback_query(F.data == "set_long_break_interval")
-async def set_long_break_interval(callback: CallbackQuery, state: FSMContext):
-    """Начать настройку интервала длинного перерыва"""
-    user_id = callback.from_user.id
-    
     if user_id in active_timers or user_id in active_cycles:
         await callback.answer("⏸ Остановите активный таймер или цикл перед изменением настроек!", show_alert=True)
         return
-    
-    intervals = get_user_intervals(user_id)
-    long_min = intervals['long_break'] // 60
+
+    target_state, title, min_attr = _SET_INTERVAL_CALLBACKS[callback.data]
+    intervals = await get_user_intervals(user_id)
     await callback.answer()
     await callback.message.edit_text(
-        f"🌴 Настройка интервала длинного перерыва\n\n"
-        f"Текущее значение: {long_min} минут\n\n"
+        f"{title}\n\n"
+        f"Текущее значение: {getattr(intervals, min_attr)} минут\n\n"
         f"Введите новое значение в минутах (число):",
         reply_markup=get_settings_keyboard()
     )
-    await state.set_state(PomodoroStates.waiting_for_long_break_interval)
+    await state.set_state(target_state)
 
 
-@dp.message(PomodoroStates.waiting_for_pomodoro_interval)
-async def process_pomodoro_interval(message: Message, state: FSMContext):
-    """Обработать ввод интервала Pomodoro"""
-    try:
-        value = int(message.text)
-        if value <= 0:
-            await message.answer("❌ Значение должно быть положительным числом! Попробуйте снова:")
-            return
-        
-        intervals = get_user_intervals(message.from_user.id)
-        intervals['pomodoro'] = value * 60
-        await message.answer(
-            f"✅ Интервал Pomodoro установлен: {value} минут",
-            reply_markup=get_main_keyboard(message.from_user.id)
-        )
-        await state.clear()
-    except ValueError:
-        await message.answer("❌ Пожалуйста, введите число! Попробуйте снова:")
+# Ключ интервала и его название для каждого состояния ввода
+_INTERVAL_STATES: Dict[str, tuple] = {
+    PomodoroStates.waiting_for_pomodoro_interval.state: ("pomodoro", "Pomodoro"),
+    PomodoroStates.waiting_for_short_break_interval.state: ("short_break", "короткого перерыва"),
+    PomodoroStates.waiting_for_long_break_interval.state: ("long_break", "длинного перерыва"),
+}
 
 
-@dp.message(PomodoroStates.waiting_for_short_break_interval)
-async def process_short_break_interval(message: Message, state: FSMContext):
-    """Обработать ввод интервала короткого перерыва"""
-    try:
-        value = int(message.text)
-        if value <= 0:
-            await message.answer("❌ Значение должно быть положительным числом! Попробуйте снова:")
-            return
-        
-        intervals = get_user_intervals(message.from_user.id)
-        intervals['short_break'] = value * 60
-        await message.answer(
-            f"✅ Интервал короткого перерыва установлен: {value} минут",
-            reply_markup=get_main_keyboard(message.from_user.id)
-        )
-        await state.clear()
-    except ValueError:
+@dp.message(StateFilter(*_INTERVAL_STATES))
+async def process_interval_input(message: Message, state: FSMContext):
+    """Обработать ввод нового значения интервала"""
+    key, label = _INTERVAL_STATES[await state.get_state()]
+
+    # isdecimal-проверка вместо try/except: не поднимаем исключение на каждый
+    # неверный ввод; isdecimal принимает ровно те символы, которые понимает int()
+    text = message.text.strip()
+    if not text.isdecimal():
         await message.answer("❌ Пожалуйста, введите число! Попробуйте снова:")
+        return
 
+    value = int(text)
+    if value <= 0:
+        await message.answer("❌ Значение должно быть положительным числом! Попробуйте снова:")
+        return
 
-@dp.message(PomodoroStates.waiting_for_long_break_interval)
-async def process_long_break_interval(message: Message, state: FSMContext):
-    """Обработать ввод интервала длинного перерыва"""
-    try:
-        value = int(message.text)
-        if value <= 0:
-            await message.answer("❌ Значение должно быть положительным числом! Попробуйте снова:")
-            return
-        
-        intervals = get_user_intervals(message.from_user.id)
-        intervals['long_break'] = value * 60
-        await message.answer(
-            f"✅ Интервал длинного перерыва установлен: {value} минут",
-            reply_markup=get_main_keyboard(message.from_user.id)
-        )
-        await state.clear()
-    except ValueError:
-        await message.answer("❌ Пожалуйста, введите число! Попробуйте снова:")
+    await set_user_interval(message.from_user.id, key, value * 60)
+    await message.answer(
+        f"✅ Интервал {label} установлен: {value} минут",
+        reply_markup=await get_main_keyboard(message.from_user.id)
+    )
+    await state.clear()
 
 
 @dp.callback_query(F.data == "stop_timer")
@@ -517,17 +557,17 @@ async def stop_timer(callback: CallbackQuery):
     user_id = callback.from_user.id
     
     stopped = False
-    
+
     # Останавливаем цикл если активен
-    if user_id in active_cycles:
-        active_cycles[user_id].cancel()
-        del active_cycles[user_id]
+    cycle_task = active_cycles.pop(user_id, None)
+    if cycle_task:
+        cycle_task.cancel()
         stopped = True
-    
+
     # Останавливаем таймер если активен
-    if user_id in active_timers:
-        active_timers[user_id].cancel()
-        del active_timers[user_id]
+    timer_task = active_timers.pop(user_id, None)
+    if timer_task:
+        timer_task.cancel()
         stopped = True
     
     if not stopped:
@@ -537,7 +577,7 @@ async def stop_timer(callback: CallbackQuery):
     await callback.answer("⏹️ Остановлено!")
     await callback.message.edit_text(
         "⏹️ Таймер/цикл остановлен.\n\nВыберите действие:",
-        reply_markup=get_main_keyboard(user_id)
+        reply_markup=await get_main_keyboard(user_id)
     )
 
 
@@ -547,48 +587,38 @@ async def back_to_main(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     await callback.answer()
     user_id = callback.from_user.id
-    intervals = get_user_intervals(user_id)
-    pomodoro_min = intervals['pomodoro'] // 60
-    short_min = intervals['short_break'] // 60
-    long_min = intervals['long_break'] // 60
+    intervals = await get_user_intervals(user_id)
     text = (
         f"🍅 Главное меню\n\n"
         f"⚙️ Текущие настройки:\n"
-        f"• Pomodoro: {pomodoro_min} мин\n"
-        f"• Короткий перерыв: {short_min} мин\n"
-        f"• Длинный перерыв: {long_min} мин"
+        f"{intervals.settings_block}"
     )
-    await callback.message.edit_text(text, reply_markup=get_main_keyboard(user_id))
+    await callback.message.edit_text(text, reply_markup=await get_main_keyboard(user_id))
 
 
 @dp.callback_query(F.data == "show_stats")
 async def show_stats(callback: CallbackQuery):
     """Показать статистику"""
     user_id = callback.from_user.id
-    stats = get_user_stats(user_id)
-    intervals = get_user_intervals(user_id)
-    pomodoro_min = intervals['pomodoro'] // 60
-    short_min = intervals['short_break'] // 60
-    long_min = intervals['long_break'] // 60
+    stats = await get_user_stats(user_id)
+    intervals = await get_user_intervals(user_id)
     stats_text = (
         f"📊 Ваша статистика:\n\n"
-        f"🍅 Завершено Pomodoro: {stats['pomodoros']}\n"
-        f"☕ Коротких перерывов: {stats['short_breaks']}\n"
-        f"🌴 Длинных перерывов: {stats['long_breaks']}\n\n"
+        f"🍅 Завершено Pomodoro: {stats.pomodoros}\n"
+        f"☕ Коротких перерывов: {stats.short_breaks}\n"
+        f"🌴 Длинных перерывов: {stats.long_breaks}\n\n"
         f"⚙️ Текущие настройки:\n"
-        f"• Pomodoro: {pomodoro_min} мин\n"
-        f"• Короткий перерыв: {short_min} мин\n"
-        f"• Длинный перерыв: {long_min} мин\n"
+        f"{intervals.settings_block}\n"
     )
     
-    if stats['pomodoros'] > 0:
-        total_work_time = stats['pomodoros'] * intervals['pomodoro']
+    if stats.pomodoros > 0:
+        total_work_time = stats.pomodoros * intervals.pomodoro
         stats_text += f"\n⏱ Всего времени работы: {total_work_time} секунд"
     else:
         stats_text += "\n💡 Начните свой первый Pomodoro!"
     
     await callback.answer()
-    await callback.message.edit_text(stats_text, reply_markup=get_main_keyboard(user_id))
+    await callback.message.edit_text(stats_text, reply_markup=await get_main_keyboard(user_id))
 
 
 async def main():